@@ -0,0 +1,55 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, initializedcheck=False
+# distutils: extra_compile_args = -O3 -march=native
+# backend/_scorer.pyx
+# Optional ahead-of-time compiled skill-overlap kernel for recommender.skill_overlap_counts
+# Build in place with: cythonize -i _scorer.pyx
+import numpy as np
+
+
+def skill_overlap_counts(const int[::1] indptr, const int[::1] indices, const int[::1] user_ids,
+                         const int[::1] partial_ids, const unsigned char[:, ::1] related):
+    """Per-row exact / partial skill match counts over CSR arrays; same results as recommender._skill_overlap_loops"""
+    cdef Py_ssize_t n = indptr.shape[0] - 1
+    cdef Py_ssize_t n_user = user_ids.shape[0]
+    cdef Py_ssize_t n_partial = partial_ids.shape[0]
+    cdef Py_ssize_t row, i, j, k, start, end
+    cdef bint is_exact
+
+    exact_arr = np.zeros(n, dtype=np.int32)
+    partial_arr = np.zeros(n, dtype=np.int32)
+    cdef int[::1] exact = exact_arr
+    cdef int[::1] partial = partial_arr
+
+    with nogil:
+        for row in range(n):
+            start = indptr[row]
+            end = indptr[row + 1]
+
+            # Exact matches: merge the two sorted id lists
+            i = start
+            j = 0
+            while i < end and j < n_user:
+                if indices[i] == user_ids[j]:
+                    exact[row] += 1
+                    i += 1
+                    j += 1
+                elif indices[i] < user_ids[j]:
+                    i += 1
+                else:
+                    j += 1
+
+            # Partial matches: count each non-exact user skill once if any internship skill is related
+            for k in range(n_partial):
+                is_exact = False
+                for i in range(start, end):
+                    if indices[i] == partial_ids[k]:
+                        is_exact = True
+                        break
+                if is_exact:
+                    continue
+                for i in range(start, end):
+                    if related[k, indices[i]]:
+                        partial[row] += 1
+                        break
+
+    return exact_arr, partial_arr
@@ -1,18 +1,48 @@
 # backend/app.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from recommender import load_internships, load_embeddings, save_embeddings, precompute_doc_embeddings_new, recommend, check_and_update_embeddings, recommend_with_validation
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+from recommender import load_internships, load_embeddings, save_embeddings, file_lock, write_file_atomic, read_json_mmap, precompute_doc_embeddings_new, recommend_matrix, recommend_matrix_batch, check_and_update_embeddings, get_processed_source, embed_query_normalized, get_embedding_key, build_prefilter_indexes, prefilter_rows, build_skill_matrix, public_internship, SKILL_SPLIT
 import os
+import sys
+import threading
+import uuid
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import orjson
+from datetime import datetime
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from typing import Optional
+from typing import List, Optional
 
 load_dotenv()
 
 DATA_PATH = "internships.json"
 EMBEDDINGS_PATH = "embeddings.json"
 
-app = FastAPI(title="PM Internship Recommender API", version="2.0")
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson (also handles numpy scalars and arrays)"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Load data and warm the embedding matrix before serving the first request"""
+    try:
+        matrix = get_current_data()["matrix"]
+        if matrix.size:
+            # The serving matrix is an in-memory float32 copy; one GEMV initializes BLAS
+            matrix @ matrix[0]
+        embed_query_normalized("warmup")
+        print("✅ Warmup complete")
+    except Exception as e:
+        print(f"Warning: Warmup failed: {e}")
+    yield
+
+app = FastAPI(title="PM Internship Recommender API", version="2.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS for frontend local dev (adjust origin for production)
 app.add_middleware(
@@ -21,6 +51,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress larger JSON payloads (e.g. the full /api/internships listing)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Request models
 class ProfileRequest(BaseModel):
@@ -28,6 +60,7 @@ class ProfileRequest(BaseModel):
     skills: str
     location: str
     top_k: int = 5
+    prefilter: bool = False  # Only score internships matching the location (or remote) or education
 
 class ProfileRequestWithValidation(BaseModel):
     education: str
@@ -35,26 +68,156 @@ class ProfileRequestWithValidation(BaseModel):
     location: str
     top_k: Optional[int] = 5
     use_validation: Optional[bool] = False
+    prefilter: Optional[bool] = False
 
-# Global variables to cache data and embeddings
-cached_internships = None
-cached_embeddings = None
-last_check_time = 0
+# Snapshot of the loaded data and everything derived from it (see build_data_snapshot).
+# It is rebuilt on data updates and swapped in as a whole, so readers take one reference
+# and never see a matrix from one load next to metadata from another.
+cached_data = None
+# Serializes data checks / reloads and snapshot swaps
+data_lock = threading.Lock()
 
-def get_current_data():
-    """Get current internships and embeddings, updating if necessary"""
-    global cached_internships, cached_embeddings, last_check_time
+def build_matrix_cache(internships, embeddings):
+    """Gather available embeddings into an L2-normalized float32 matrix with parallel id/metadata lists"""
+    embedding_matrix, embedding_keys = embeddings
+    key_to_row = {key: row for row, key in enumerate(embedding_keys)}
+    
+    ids = []
+    meta = []
+    rows = []
+    for internship in internships:
+        row = key_to_row.get(get_embedding_key(internship))
+        if row is not None:
+            ids.append(internship['_id'])
+            meta.append(internship)
+            rows.append(row)
+    
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), ids, meta
+    
+    # Rows are stored L2-normalized, so gathering them is all that is needed
+    matrix = np.asarray(embedding_matrix[rows], dtype=np.float32)
+    return matrix, ids, meta
+
+def build_stats_cache(internships):
+    """Collect unique locations, skills, education levels and organizations"""
+    stats = {"locations": set(), "skills": set(), "education_levels": set(), "orgs": set()}
+    
+    for internship in internships:
+        if internship.get("location"):
+            stats["locations"].add(internship["location"])
+        if internship.get("skills"):
+            for skill in SKILL_SPLIT.split(internship["skills"]):
+                stats["skills"].add(skill.strip())
+        if internship.get("required_education"):
+            stats["education_levels"].add(internship["required_education"])
+        if internship.get("org"):
+            stats["orgs"].add(internship["org"])
+    
+    return stats
+
+# LRU cache of recommendation results keyed by (data_version, normalized query)
+RECOMMEND_CACHE_SIZE = 4096
+recommend_cache = OrderedDict()
+recommend_cache_lock = threading.Lock()
+data_version = 0
+
+# Cache-Control for the pre-serialized /api/internships body
+INTERNSHIPS_CACHE_CONTROL = "public, max-age=60"
+
+def build_data_snapshot(internships, embeddings, source):
+    """
+    Build the data snapshot: internships, embeddings and the caches derived from them
+    source: (mtime_ns, hash) of the internships file the internships were loaded from
+    """
+    matrix, ids, meta = build_matrix_cache(internships, embeddings)
+    # Scoring relies on float32 end to end; a float64 matrix would silently upcast every query
+    assert matrix.dtype == np.float32, f"embedding matrix must be float32, got {matrix.dtype}"
+    loc_index, edu_index = build_prefilter_indexes(meta)
+    internships_body = orjson.dumps({
+        "count": len(internships),
+        "internships": [public_internship(i) if isinstance(i, dict) else i for i in internships]
+    })
+    
+    return {
+        "internships": internships,
+        "embeddings": embeddings,
+        "source": source,
+        # Embedding matrix with rows aligned to ids / meta
+        "matrix": matrix,
+        "ids": ids,
+        "meta": meta,
+        # Unique values for /api/stats and the skill id matrix over meta rows
+        "stats": build_stats_cache(internships),
+        "skill_matrix": build_skill_matrix(meta),
+        # Location / education -> matrix rows, used to prefilter candidates before scoring
+        "loc_index": loc_index,
+        "edu_index": edu_index,
+        # Pre-serialized /api/internships body and its ETag
+        "internships_body": internships_body,
+        "internships_etag": '"' + hashlib.md5(internships_body).hexdigest() + '"'
+    }
+
+def publish_data_snapshot(data):
+    """Swap in a new data snapshot under a new data version"""
+    global cached_data, data_version
     
-    internships, embeddings, updated = check_and_update_embeddings(
-        DATA_PATH, EMBEDDINGS_PATH, cached_internships, cached_embeddings
+    # Bumping the version keeps results computed on the old data out of the cache
+    with recommend_cache_lock:
+        data_version += 1
+        data["version"] = data_version
+        cached_data = data
+        recommend_cache.clear()
+
+def normalize_query(education, skills, location):
+    """Canonical (education, skills, location): lowercased, with skills de-duplicated and sorted"""
+    education = str(education).strip().lower() if education else ""
+    location = str(location).strip().lower() if location else ""
+    skill_tokens = sorted({s.strip().lower() for s in SKILL_SPLIT.split(str(skills or "")) if s.strip()})
+    return education, ", ".join(skill_tokens), location
+
+def cached_recommend(data, education, skills, location, top_k, prefilter=False):
+    """Recommendations for a profile on a data snapshot, served from the LRU cache when the normalized query repeats"""
+    education, skills, location = normalize_query(education, skills, location)
+    key = (data["version"], education, skills, location, top_k, bool(prefilter))
+    
+    with recommend_cache_lock:
+        results = recommend_cache.get(key)
+        if results is not None:
+            recommend_cache.move_to_end(key)
+            return results
+    
+    candidate_rows = prefilter_rows(data["loc_index"], data["edu_index"], education, location) if prefilter else None
+    results = recommend_matrix(
+        data["matrix"], data["meta"], education, skills, location,
+        top_k=top_k, candidate_rows=candidate_rows, skill_matrix=data["skill_matrix"]
     )
     
-    if updated or cached_internships is None:
-        cached_internships = internships
-        cached_embeddings = embeddings
-        print("✅ Data and embeddings updated/loaded")
+    # Empty results may come from a failed query embedding, so they are not cached
+    if results:
+        with recommend_cache_lock:
+            recommend_cache[key] = results
+            if len(recommend_cache) > RECOMMEND_CACHE_SIZE:
+                recommend_cache.popitem(last=False)
     
-    return cached_internships, cached_embeddings
+    return results
+
+def get_current_data():
+    """Get the current data snapshot, reloading internships and embeddings if necessary"""
+    with data_lock:
+        data = cached_data
+        internships, embeddings, updated = check_and_update_embeddings(
+            DATA_PATH, EMBEDDINGS_PATH,
+            data["internships"] if data else None,
+            data["embeddings"] if data else None
+        )
+        
+        if updated or data is None:
+            data = build_data_snapshot(internships, embeddings, get_processed_source(DATA_PATH, EMBEDDINGS_PATH))
+            publish_data_snapshot(data)
+            print("✅ Data and embeddings updated/loaded")
+        
+        return data
 
 @app.get("/")
 def root():
@@ -62,31 +225,23 @@ def root():
     return {
         "message": "PM Internship Recommender API is running",
         "version": "2.0",
-        "internships_loaded": len(cached_internships) if cached_internships else 0,
+        "internships_loaded": len(cached_data["internships"]) if cached_data else 0,
         "status": "healthy"
     }
 
 @app.post("/api/recommend")
 def api_recommend(req: ProfileRequest):
     try:
-        internships, embeddings = get_current_data()
+        data = get_current_data()
+        internships = data["internships"]
         
         if not internships:
             raise HTTPException(status_code=404, detail="No internships data available")
         
-        if not embeddings:
+        if not data["embeddings"][1]:
             raise HTTPException(status_code=500, detail="Embeddings not available")
         
-        # Merge internships with their embeddings for recommendation
-        internships_with_embeddings = []
-        for internship in internships:
-            internship_id = internship.get('id') or internship.get('title', '') + internship.get('org', '')
-            if internship_id in embeddings:
-                internship_copy = internship.copy()
-                internship_copy['embedding'] = embeddings[internship_id]
-                internships_with_embeddings.append(internship_copy)
-        
-        results = recommend(internships_with_embeddings, req.education, req.skills, req.location, top_k=req.top_k)
+        results = cached_recommend(data, req.education, req.skills, req.location, req.top_k, req.prefilter)
         
         return {
             "query": {
@@ -97,7 +252,7 @@ def api_recommend(req: ProfileRequest):
             "recommendations": results,
             "metadata": {
                 "total_internships": len(internships),
-                "internships_with_embeddings": len(internships_with_embeddings),
+                "internships_with_embeddings": len(data["meta"]),
                 "returned_recommendations": len(results)
             }
         }
@@ -108,33 +263,9 @@ def api_recommend(req: ProfileRequest):
 def api_recommend_with_validation(req: ProfileRequestWithValidation):
     """Recommendation endpoint with enhanced input validation"""
     try:
-        internships, embeddings = get_current_data()
+        data = get_current_data()
         
-        # Merge internships with their embeddings
-        internships_with_embeddings = []
-        for internship in internships:
-            internship_id = internship.get('id') or internship.get('title', '') + internship.get('org', '')
-            if internship_id in embeddings:
-                internship_copy = internship.copy()
-                internship_copy['embedding'] = embeddings[internship_id]
-                internships_with_embeddings.append(internship_copy)
-        
-        if req.use_validation:
-            results = recommend_with_validation(
-                internships_with_embeddings,
-                req.education,
-                req.skills, 
-                req.location,
-                req.top_k
-            )
-        else:
-            results = recommend(
-                internships_with_embeddings,
-                req.education,
-                req.skills,
-                req.location, 
-                req.top_k
-            )
+        results = cached_recommend(data, req.education, req.skills, req.location, req.top_k, req.prefilter)
         
         return {
             "query": {
@@ -150,11 +281,73 @@ def api_recommend_with_validation(req: ProfileRequestWithValidation):
         print(f"Error in validated recommendation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Largest /api/recommend/batch request; bounds the (profiles x internships) score matrix
+MAX_BATCH_PROFILES = 32
+
+@app.post("/api/recommend/batch")
+def api_recommend_batch(reqs: List[ProfileRequest]):
+    """Recommendations for a list of profiles, scored together in one matrix product"""
+    try:
+        if len(reqs) > MAX_BATCH_PROFILES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PROFILES} profiles per batch")
+        
+        data = get_current_data()
+        internships = data["internships"]
+        
+        if not internships:
+            raise HTTPException(status_code=404, detail="No internships data available")
+        
+        if not data["embeddings"][1]:
+            raise HTTPException(status_code=500, detail="Embeddings not available")
+        
+        # Prefiltered profiles score their own candidate rows; the rest share one matrix product
+        batch_results = [
+            cached_recommend(data, req.education, req.skills, req.location, req.top_k, True) if req.prefilter else None
+            for req in reqs
+        ]
+        batched = [i for i, req in enumerate(reqs) if not req.prefilter]
+        if batched:
+            scored = recommend_matrix_batch(
+                data["matrix"],
+                data["meta"],
+                # Normalized like cached_recommend, so a profile ranks the same on both endpoints
+                [(*normalize_query(reqs[i].education, reqs[i].skills, reqs[i].location), reqs[i].top_k) for i in batched],
+                skill_matrix=data["skill_matrix"]
+            )
+            for i, results in zip(batched, scored):
+                batch_results[i] = results
+        
+        return {
+            "results": [
+                {
+                    "query": {
+                        "education": req.education,
+                        "skills": req.skills,
+                        "location": req.location
+                    },
+                    "recommendations": results
+                }
+                for req, results in zip(reqs, batch_results)
+            ],
+            "metadata": {
+                "total_internships": len(internships),
+                "internships_with_embeddings": len(data["meta"]),
+                "profiles": len(reqs)
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/internships")
-def api_internships():
+def api_internships(request: Request):
     try:
-        internships, _ = get_current_data()
-        return {"count": len(internships), "internships": internships}
+        data = get_current_data()
+        headers = {"ETag": data["internships_etag"], "Cache-Control": INTERNSHIPS_CACHE_CONTROL}
+        if data["internships_etag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=data["internships_body"], media_type="application/json", headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -162,37 +355,24 @@ def api_internships():
 def api_stats():
     """Get API statistics and internship data insights"""
     try:
-        internships, _ = get_current_data()
+        data = get_current_data()
+        internships = data["internships"]
         
         if not internships:
             return {"message": "No internships loaded"}
         
-        # Calculate statistics
-        total_internships = len(internships)
-        
-        # Get unique values for filtering
-        locations = set()
-        skills = set()
-        education_levels = set()
-        organizations = set()
-        
-        for internship in internships:
-            if internship.get("location"):
-                locations.add(internship["location"])
-            if internship.get("skills"):
-                for skill in internship["skills"].split(","):
-                    skills.add(skill.strip())
-            if internship.get("required_education"):
-                education_levels.add(internship["required_education"])
-            if internship.get("org"):
-                organizations.add(internship["org"])
+        # Unique values are precomputed in the data snapshot
+        cached_stats = data["stats"]
+        locations = cached_stats["locations"]
+        skills = cached_stats["skills"]
+        education_levels = cached_stats["education_levels"]
         
         return {
-            "total_internships": total_internships,
+            "total_internships": len(internships),
             "unique_locations": len(locations),
             "unique_skills": len(skills),
             "unique_education_levels": len(education_levels),
-            "unique_organizations": len(organizations),
+            "unique_organizations": len(cached_stats["orgs"]),
             "sample_locations": list(locations)[:10],
             "sample_skills": list(skills)[:15],
             "sample_education_levels": list(education_levels),
@@ -207,18 +387,15 @@ def api_stats():
 def api_embeddings_status():
     """Get status of embeddings"""
     try:
-        internships, embeddings = get_current_data()
+        data = get_current_data()
+        internships = data["internships"]
         
+        matrix, ids = data["embeddings"]
         total_internships = len(internships) if internships else 0
-        total_embeddings = len(embeddings) if embeddings else 0
+        total_embeddings = matrix.shape[0]
         
-        # Check which internships have embeddings
-        internships_with_embeddings = 0
-        if internships and embeddings:
-            for internship in internships:
-                internship_id = internship.get('id') or internship.get('title', '') + internship.get('org', '')
-                if internship_id in embeddings:
-                    internships_with_embeddings += 1
+        # The snapshot's ids hold one entry per internship that has an embedding
+        internships_with_embeddings = len(data["ids"]) if internships and ids else 0
         
         return {
             "total_internships": total_internships,
@@ -231,42 +408,149 @@ def api_embeddings_status():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/embeddings/recompute")
-def api_recompute_embeddings():
-    """Force recomputation of all embeddings"""
+# Background recompute jobs: job_id -> status dict, kept in a file shared by all worker
+# processes so any worker can answer a status poll; only one job runs at a time per worker.
+# A recompute refreshes the caches of the worker that ran it; with an unchanged model and
+# data the other workers already serve the same vectors.
+RECOMPUTE_JOBS_PATH = "recompute_jobs.json"
+RECOMPUTE_JOBS_KEPT = 20
+recompute_lock = threading.Lock()
+active_recompute_job = None
+
+def read_recompute_jobs():
+    """All recorded recompute jobs ({} when none)"""
     try:
-        global cached_internships, cached_embeddings
+        return read_json_mmap(RECOMPUTE_JOBS_PATH)
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def update_recompute_job(job_id, **fields):
+    """Merge fields into a recompute job's status in the shared jobs file, keeping the latest jobs only"""
+    with file_lock(RECOMPUTE_JOBS_PATH):
+        jobs = read_recompute_jobs()
+        jobs[job_id] = {**jobs.get(job_id, {}), **fields}
+        while len(jobs) > RECOMPUTE_JOBS_KEPT:
+            del jobs[next(iter(jobs))]  # Oldest first: dicts keep insertion order
+        write_file_atomic(RECOMPUTE_JOBS_PATH, lambda f: f.write(orjson.dumps(jobs)))
+
+def run_recompute_job(job_id, data):
+    """Recompute all embeddings of a data snapshot in the background and swap them into the caches"""
+    global active_recompute_job
+    
+    try:
+        update_recompute_job(job_id, status="running")
+        internships = data["internships"]
+        embeddings = precompute_doc_embeddings_new(internships)
         
-        print("🔄 Force recomputing embeddings...")
-        internships, _ = get_current_data()
+        with data_lock:
+            # A reload while embedding means these rows belong to outdated internships
+            if cached_data is None or cached_data["internships"] is not internships:
+                raise RuntimeError("Internships changed during recomputation; the reloaded data was kept")
+            
+            # Stored with the hash of the file the internships were loaded from, so a
+            # file changed in the meantime is still detected and reloaded
+            source_hash = data["source"][1]
+            with file_lock(EMBEDDINGS_PATH):
+                save_embeddings(
+                    *embeddings,
+                    EMBEDDINGS_PATH,
+                    metadata={
+                        "source_file_hash": source_hash,
+                        "source_file_path": DATA_PATH
+                    }
+                )
+            publish_data_snapshot(build_data_snapshot(internships, embeddings, data["source"]))
+        
+        job = {"status": "completed", "total_embeddings": len(embeddings[1])}
+    except Exception as e:
+        print(f"Error recomputing embeddings: {e}")
+        job = {"status": "failed", "error": str(e)}
+    finally:
+        try:
+            update_recompute_job(job_id, **job, finished_at=datetime.now().isoformat())
+        except Exception as e:
+            print(f"Error recording recompute job status: {e}")
+        active_recompute_job = None
+        recompute_lock.release()
+
+@app.post("/api/embeddings/recompute", status_code=202)
+def api_recompute_embeddings(background_tasks: BackgroundTasks):
+    """Start a forced recomputation of all embeddings; poll /api/embeddings/recompute/{job_id} for progress"""
+    global active_recompute_job
+    try:
+        data = get_current_data()
+        internships = data["internships"]
         
         if not internships:
             raise HTTPException(status_code=404, detail="No internships data found")
         
-        # Force recompute by clearing existing embeddings
-        cached_embeddings = precompute_doc_embeddings_new(internships, {})
-        save_embeddings(cached_embeddings, EMBEDDINGS_PATH)
+        if not recompute_lock.acquire(blocking=False):
+            return {
+                "message": "Embeddings recomputation already running",
+                "job_id": active_recompute_job,
+                "status": read_recompute_jobs().get(active_recompute_job, {}).get("status")
+            }
+        
+        print("🔄 Force recomputing embeddings...")
+        job_id = uuid.uuid4().hex
+        try:
+            update_recompute_job(
+                job_id,
+                status="pending",
+                started_at=datetime.now().isoformat(),
+                total_internships=len(internships)
+            )
+        except Exception:
+            recompute_lock.release()
+            raise
+        active_recompute_job = job_id
+        background_tasks.add_task(run_recompute_job, job_id, data)
         
         return {
-            "message": "Embeddings recomputed successfully",
-            "total_internships": len(internships),
-            "total_embeddings": len(cached_embeddings)
+            "message": "Embeddings recomputation started",
+            "job_id": job_id,
+            "status_url": f"/api/embeddings/recompute/{job_id}"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/embeddings/recompute/{job_id}")
+def api_recompute_status(job_id: str):
+    """Status of a background embeddings recomputation"""
+    job = read_recompute_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown recompute job")
+    return {"job_id": job_id, **job}
+
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Endpoint not found", "available_endpoints": [
+    # Endpoints raise their own 404s (e.g. an unknown recompute job); keep their detail
+    detail = getattr(exc, "detail", "Not Found")
+    if detail != "Not Found":
+        return ORJSONResponse(status_code=404, content={"detail": detail})
+    return ORJSONResponse(status_code=404, content={"error": "Endpoint not found", "available_endpoints": [
         "/api/recommend",
         "/api/recommend/validated", 
+        "/api/recommend/batch",
         "/api/internships",
         "/api/stats",
         "/api/embeddings/status",
-        "/api/embeddings/recompute"
-    ]}
+        "/api/embeddings/recompute",
+        "/api/embeddings/recompute/{job_id}"
+    ]})
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Each worker process loads its own data cache; embedding files and recompute job
+    # status are shared through locked files. uvicorn[standard] provides uvloop and httptools
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", min(4, os.cpu_count() or 1)))
+    )
\ No newline at end of file
@@ -1,5 +1,6 @@
 # backend/compute_embeddings.py
-from recommender import load_internships, load_embeddings, save_embeddings, precompute_doc_embeddings_new, get_internship_id
+from recommender import load_internships, load_embeddings, save_embeddings, precompute_doc_embeddings_new, get_matrix_path, get_embedding_key, drop_stale_embeddings
+import numpy as np
 import os
 import sys
 from dotenv import load_dotenv
@@ -33,17 +34,14 @@ def main():
         sys.exit(1)
     
     print(f"📂 Loading existing embeddings from: {EMBEDDINGS_PATH}")
-    existing_embeddings = load_embeddings(EMBEDDINGS_PATH)
+    existing_matrix, existing_ids = load_embeddings(EMBEDDINGS_PATH)
     
     total_internships = len(internships)
-    existing_embeddings_count = len(existing_embeddings) if existing_embeddings else 0
+    existing_embeddings_count = len(existing_ids)
     
     # Count how many internships already have embeddings
-    internships_with_embeddings = 0
-    for internship in internships:
-        internship_id = get_internship_id(internship)
-        if existing_embeddings and internship_id in existing_embeddings:
-            internships_with_embeddings += 1
+    valid_ids = {get_embedding_key(internship) for internship in internships}
+    internships_with_embeddings = len(valid_ids & set(existing_ids))
     
     print(f"📊 Statistics:")
     print(f"   • Total internships: {total_internships}")
@@ -55,7 +53,7 @@ def main():
     if existing_embeddings_count > 0:
         print(f"💾 Creating backup at: {BACKUP_PATH}")
         try:
-            save_embeddings(existing_embeddings, BACKUP_PATH)
+            save_embeddings(existing_matrix, existing_ids, BACKUP_PATH)
             print("✅ Backup created successfully")
         except Exception as e:
             print(f"⚠️  Warning: Backup failed: {e}")
@@ -73,10 +71,15 @@ def main():
     
     try:
         # Use existing embeddings as base and compute missing ones
-        updated_embeddings = precompute_doc_embeddings_new(internships, existing_embeddings or {})
+        # Partial progress is saved periodically so a failed run can resume
+        updated_matrix, updated_ids = precompute_doc_embeddings_new(
+            internships,
+            (existing_matrix, existing_ids),
+            checkpoint=lambda partial_matrix, partial_ids: save_embeddings(partial_matrix, partial_ids, EMBEDDINGS_PATH)
+        )
         
         # Validate embeddings were computed
-        new_embeddings_count = len(updated_embeddings)
+        new_embeddings_count = len(updated_ids)
         
         if new_embeddings_count > existing_embeddings_count:
             print(f"✅ Successfully computed {new_embeddings_count - existing_embeddings_count} new embeddings")
@@ -94,11 +97,12 @@ def main():
     # Save results
     print(f"\n💾 Saving embeddings to: {EMBEDDINGS_PATH}")
     try:
-        save_embeddings(updated_embeddings, EMBEDDINGS_PATH)
+        save_embeddings(updated_matrix, updated_ids, EMBEDDINGS_PATH)
         
         # Verify save was successful
-        verification = load_embeddings(EMBEDDINGS_PATH)
-        verified_embeddings_count = len(verification) if verification else 0
+        _, verified_ids = load_embeddings(EMBEDDINGS_PATH)
+        verification = set(verified_ids)
+        verified_embeddings_count = len(verified_ids)
         
         if verified_embeddings_count == new_embeddings_count:
             print("✅ Embeddings saved and verified successfully")
@@ -112,11 +116,7 @@ def main():
         sys.exit(1)
     
     # Final verification with internships
-    final_internships_with_embeddings = 0
-    for internship in internships:
-        internship_id = get_internship_id(internship)
-        if internship_id in verification:
-            final_internships_with_embeddings += 1
+    final_internships_with_embeddings = len(valid_ids & verification)
     
     print("\n" + "=" * 60)
     print("🎉 EMBEDDING COMPUTATION COMPLETED!")
@@ -127,12 +127,12 @@ def main():
     print(f"   • Internships with embeddings: {final_internships_with_embeddings}")
     print(f"   • Coverage: {(final_internships_with_embeddings/len(internships)*100):.1f}%")
     
-    if os.path.exists(EMBEDDINGS_PATH):
-        embeddings_size = os.path.getsize(EMBEDDINGS_PATH)/1024/1024
-        print(f"   • Embeddings file size: {embeddings_size:.1f} MB")
+    if os.path.exists(get_matrix_path(EMBEDDINGS_PATH)):
+        embeddings_size = os.path.getsize(get_matrix_path(EMBEDDINGS_PATH))/1024/1024
+        print(f"   • Embeddings matrix size: {embeddings_size:.1f} MB")
     
-    if os.path.exists(BACKUP_PATH):
-        backup_size = os.path.getsize(BACKUP_PATH)/1024/1024
+    if os.path.exists(get_matrix_path(BACKUP_PATH)):
+        backup_size = os.path.getsize(get_matrix_path(BACKUP_PATH))/1024/1024
         print(f"   • Backup size: {backup_size:.1f} MB")
     
     print("\n🚀 Your recommendation system is now ready!")
@@ -144,13 +144,13 @@ def validate_embeddings():
     """
     print("🔍 Validating embeddings...")
     internships = load_internships(INTERNSHIPS_PATH)
-    embeddings = load_embeddings(EMBEDDINGS_PATH)
+    matrix, ids = load_embeddings(EMBEDDINGS_PATH)
     
     if not internships:
         print("❌ No internships found")
         return False
     
-    if not embeddings:
+    if not ids:
         print("❌ No embeddings found")
         return False
     
@@ -158,20 +158,23 @@ def validate_embeddings():
     invalid_embeddings = 0
     missing_embeddings = 0
     
+    id_to_row = {internship_id: row for row, internship_id in enumerate(ids)}
+    
     for internship in internships:
-        internship_id = get_internship_id(internship)
+        internship_id = internship['_id']
+        key = get_embedding_key(internship)
         
-        if internship_id not in embeddings:
+        if key not in id_to_row:
             missing_embeddings += 1
             continue
             
         try:
-            emb = embeddings[internship_id]
-            if isinstance(emb, list) and len(emb) > 0 and all(isinstance(x, (int, float)) for x in emb):
+            emb = matrix[id_to_row[key]]
+            if emb.size > 0 and np.isfinite(emb).all():
                 valid_embeddings += 1
             else:
                 invalid_embeddings += 1
-                print(f"⚠️  Invalid embedding for {internship_id}: {type(emb)}")
+                print(f"⚠️  Invalid embedding for {internship_id}: non-finite or empty vector")
         except Exception as e:
             invalid_embeddings += 1
             print(f"⚠️  Error validating embedding for {internship_id}: {e}")
@@ -181,7 +184,7 @@ def validate_embeddings():
     print(f"   • Invalid embeddings: {invalid_embeddings}")
     print(f"   • Missing embeddings: {missing_embeddings}")
     print(f"   • Total internships: {len(internships)}")
-    print(f"   • Total embeddings in file: {len(embeddings)}")
+    print(f"   • Total embeddings in file: {len(ids)}")
     
     if invalid_embeddings > 0:
         print("❌ Some embeddings are invalid and need recomputation")
@@ -200,35 +203,31 @@ def clean_orphaned_embeddings():
     print("🧹 Cleaning orphaned embeddings...")
     
     internships = load_internships(INTERNSHIPS_PATH)
-    embeddings = load_embeddings(EMBEDDINGS_PATH)
+    matrix, ids = load_embeddings(EMBEDDINGS_PATH)
     
-    if not internships or not embeddings:
+    if not internships or not ids:
         print("❌ Cannot clean - missing internships or embeddings data")
         return
     
-    # Get all valid internship IDs
-    valid_ids = set()
-    for internship in internships:
-        internship_id = get_internship_id(internship)
-        valid_ids.add(internship_id)
+    # Keys of the current internship texts; anything else belongs to removed or edited internships
+    valid_ids = {get_embedding_key(internship) for internship in internships}
     
     # Find orphaned embeddings
-    orphaned_ids = set(embeddings.keys()) - valid_ids
+    orphaned_ids = set(ids) - valid_ids
     
     if orphaned_ids:
         print(f"🗑️  Found {len(orphaned_ids)} orphaned embeddings")
         
         # Create backup
         backup_path = f"{EMBEDDINGS_PATH}.pre_clean_backup"
-        save_embeddings(embeddings, backup_path)
+        save_embeddings(matrix, ids, backup_path)
         print(f"💾 Created backup at: {backup_path}")
         
         # Remove orphaned embeddings
-        for orphaned_id in orphaned_ids:
-            del embeddings[orphaned_id]
+        kept_matrix, kept_ids = drop_stale_embeddings(matrix, ids, valid_ids)
         
         # Save cleaned embeddings
-        save_embeddings(embeddings, EMBEDDINGS_PATH)
+        save_embeddings(kept_matrix, kept_ids, EMBEDDINGS_PATH)
         print(f"✅ Cleaned embeddings saved. Removed {len(orphaned_ids)} orphaned entries")
     else:
         print("✅ No orphaned embeddings found")
@@ -3,61 +3,306 @@
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from dotenv import load_dotenv
-import os, json, numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import os, numpy as np
+import orjson
+import mmap
+from scipy import sparse
 import hashlib
+import re
+import bisect
+import sys
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import fcntl  # POSIX file locks
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows file locks
+
+try:
+    import simsimd  # Optional: SIMD-tuned similarity kernels
+except ImportError:
+    simsimd = None
+
+try:
+    from numba import njit  # Optional: compiled skill-overlap kernel
+except ImportError:
+    njit = None
+
+try:
+    import _scorer  # Optional: ahead-of-time compiled skill-overlap kernel (see _scorer.pyx)
+except ImportError:
+    _scorer = None
+
+try:
+    import ahocorasick  # Optional: substring matching of skills (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
 load_dotenv()
 
 # Initialize embeddings using your provided API wrapper
 # EMBED_MODEL_NAME = "models/embedding-001"
-# EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
-# HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 # embeddings = GoogleGenerativeAIEmbeddings(model=EMBED_MODEL_NAME, dimensions=32)
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL_NAME)
+
+# Separator between skills in skill lists ("python, sql" or "python; sql")
+SKILL_SPLIT = re.compile(r"[,;]\s*")
+
+# Distinct skills strings whose token sets are kept (internship skills repeat on every query)
+SKILL_TOKEN_CACHE_SIZE = 16384
+
+# Distinct query strings whose embeddings are kept
+QUERY_EMBED_CACHE_SIZE = 1024
+
+# Documents per embed_documents call and number of calls kept in flight. The local
+# HuggingFace model already uses every core, so calls run one at a time by default;
+# raise EMBED_MAX_WORKERS for remote embedding APIs, where calls wait on the network.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", 1))
+
+# Fields attached by load_internships for internal use; never returned by the API or saved
+INTERNAL_FIELDS = ('_id', '_key')
 
 def load_internships(path="internships.json"):
-    """Load internships from JSON file"""
+    """
+    Load internships from JSON file, attaching each internship's stable id as '_id'
+    and its embedding store key as '_key' (see INTERNAL_FIELDS)
+    """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+        internships = read_json_mmap(path)
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
         print(f"Error loading internships: {e}")
         return []
+    
+    # Compute ids and keys once here instead of in every per-request / per-update loop
+    for internship in internships:
+        if isinstance(internship, dict):
+            internship['_id'] = get_internship_id(internship)
+            # Always from the current text: a '_key' present in the source file may be stale
+            internship['_key'] = get_text_key(get_internship_text(internship))
+    
+    return internships
+
+def public_internship(internship):
+    """Copy of an internship without the INTERNAL_FIELDS attached at load time"""
+    return {key: value for key, value in internship.items() if key not in INTERNAL_FIELDS}
 
 def save_internships(data, path="internships.json"):
     """Save internships to JSON file (kept for backward compatibility)"""
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        data = [public_internship(item) if isinstance(item, dict) else item for item in data]
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
     except Exception as e:
         print(f"Error saving internships: {e}")
 
+def get_matrix_path(path="embeddings.json"):
+    """Path of the .npy embedding matrix stored next to the embeddings JSON file"""
+    return os.path.splitext(path)[0] + ".npy"
+
+def get_scales_path(path="embeddings.json"):
+    """Path of the per-row int8 quantization scales stored next to the embeddings JSON file"""
+    return os.path.splitext(path)[0] + ".scales.npy"
+
+def write_file_atomic(path, write):
+    """
+    Write a file through a uniquely named temporary file in the same directory and swap
+    it in, so concurrent writers never share a temporary file and readers never see a
+    partial one. write(f) receives the open binary file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False) as f:
+        tmp_path = f.name
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.unlink(tmp_path)
+            raise
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive inter-process lock on a '.lock' file next to path. Held while embeddings
+    are computed and saved, so worker processes starting together do not all embed the
+    corpus and overwrite each other's files.
+    """
+    with open(path + ".lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Retries for ~10 s, then raises
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_embeddings_metadata(path="embeddings.json"):
+    """Metadata dict of an embeddings file ({} when missing or unreadable)"""
+    if os.path.exists(path):
+        try:
+            return read_json_mmap(path).get("metadata", {})
+        except Exception:
+            pass
+    return {}
+
+def read_json_mmap(path):
+    """
+    Parse a JSON file straight from a read-only memory map.
+    orjson reads the mapped pages directly, so the file is never copied into a
+    Python bytes object before parsing.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise orjson.JSONDecodeError("Empty file", "", 0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            return orjson.loads(view)
+
+def normalize_rows(matrix):
+    """L2-normalize the rows of a writable float32 matrix in place (zero rows stay zero) and return it"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def quantize_embeddings(matrix):
+    """
+    Quantize embeddings to int8 (step = max(|v|) / 127 per row) with one float32 scale
+    per row. The scale is 1 / ||q||, so dequantized rows come out L2-normalized.
+    Returns: (int8 matrix, float32 scales)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix.astype(np.int8), np.ones(len(matrix), dtype=np.float32)
+    
+    steps = np.abs(matrix).max(axis=1) / 127.0
+    steps[steps == 0] = 1.0
+    quantized = np.clip(np.round(matrix / steps[:, None]), -127, 127).astype(np.int8)
+    
+    norms = np.linalg.norm(quantized.astype(np.float32), axis=1)
+    norms[norms == 0] = 1.0
+    return quantized, (1.0 / norms).astype(np.float32)
+
+def dequantize_embeddings(quantized, scales):
+    """Reconstruct float32 embeddings from an int8 matrix and its per-row scales"""
+    return np.multiply(quantized, np.asarray(scales, dtype=np.float32)[:, None], dtype=np.float32)
+
+def empty_embeddings():
+    """Empty embeddings as a (matrix, ids) pair"""
+    return np.empty((0, 0), dtype=np.float32), []
+
 def load_embeddings(path="embeddings.json"):
-    """Load embeddings from separate JSON file"""
+    """
+    Load embeddings as a (matrix, ids) pair with L2-normalized float32 rows.
+    The JSON file holds metadata and the row-aligned ids; the matrix is
+    read through a memory map of the .npy file next to it and int8 matrices are
+    dequantized with their per-row scales (already normalized when the metadata
+    says so); the returned matrix is always an in-memory float32 copy.
+    Legacy JSON files with inline vectors are converted in memory. Embeddings saved
+    for a different EMBED_MODEL_NAME are ignored, so they are recomputed.
+    """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("embeddings", {})
-    except (FileNotFoundError, json.JSONDecodeError) as e:
+        data = read_json_mmap(path)
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
         print(f"Info: No existing embeddings file found: {e}")
-        return {}
+        return empty_embeddings()
+    
+    # Legacy format: {"embeddings": {internship_id: embedding_vector}}
+    if "embeddings" in data:
+        legacy_embeddings = data.pop("embeddings")
+        if not legacy_embeddings:
+            return empty_embeddings()
+        ids = list(legacy_embeddings)
+        # Fill a preallocated float32 buffer row by row instead of building a list of lists
+        matrix = np.empty((len(ids), len(legacy_embeddings[ids[0]])), dtype=np.float32)
+        for row, internship_id in enumerate(ids):
+            matrix[row] = legacy_embeddings.pop(internship_id)
+        return normalize_rows(matrix), ids
+    
+    ids = data.get("ids", [])
+    if not ids:
+        return empty_embeddings()
+    
+    # Keys only hash the text, so rows from another model would look current
+    stored_model = data.get("metadata", {}).get("embedding_model")
+    if stored_model is not None and stored_model != EMBED_MODEL_NAME:
+        print(f"Info: Embeddings were computed with {stored_model}, not {EMBED_MODEL_NAME}; ignoring them")
+        return empty_embeddings()
+    
+    try:
+        matrix = np.load(get_matrix_path(path), mmap_mode="r")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Info: No existing embeddings matrix found: {e}")
+        return empty_embeddings()
+    
+    if matrix.shape[0] != len(ids):
+        print(f"Warning: Embeddings matrix has {matrix.shape[0]} rows for {len(ids)} ids, ignoring it")
+        return empty_embeddings()
+    
+    if matrix.dtype == np.int8:
+        try:
+            scales = np.load(get_scales_path(path))
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Info: No embedding scales found for quantized matrix: {e}")
+            return empty_embeddings()
+        matrix = dequantize_embeddings(matrix, scales)
+        if not data.get("metadata", {}).get("normalized"):
+            normalize_rows(matrix)
+    else:
+        # Keep the whole scoring path in float32 (half the bandwidth of float64)
+        matrix = normalize_rows(np.array(matrix, dtype=np.float32))
+    
+    return matrix, ids
 
-def save_embeddings(embeddings_dict, path="embeddings.json"):
-    """Save embeddings to separate JSON file with metadata"""
+def save_embeddings(matrix, ids, path="embeddings.json", metadata=None, write_matrix=True):
+    """
+    Save embeddings as an int8 .npy matrix with per-row float32 scales that also
+    L2-normalize the rows (see quantize_embeddings), plus a JSON
+    file with metadata and row-aligned ids. Files are written under unique temporary
+    names and swapped in, so memory-mapped readers of the previous matrix are never
+    truncated underneath. Hold file_lock(path) when other processes may save too.
+    """
     try:
+        if write_matrix:
+            quantized, scales = quantize_embeddings(matrix)
+            for target, array in ((get_scales_path(path), scales), (get_matrix_path(path), quantized)):
+                write_file_atomic(target, lambda f: np.save(f, array))
+        
         data = {
             "metadata": {
                 "created_at": datetime.now().isoformat(),
-                "total_embeddings": len(embeddings_dict),
-                "embedding_model": EMBED_MODEL_NAME
+                "total_embeddings": len(ids),
+                "embedding_model": EMBED_MODEL_NAME,
+                "dimensions": int(matrix.shape[1]) if len(ids) else 0,
+                "quantization": "int8",
+                "normalized": True,
+                **(metadata or {})
             },
-            "embeddings": embeddings_dict
+            "ids": list(ids)
         }
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        write_file_atomic(path, lambda f: f.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)))
     except Exception as e:
         print(f"Error saving embeddings: {e}")
 
@@ -72,50 +317,87 @@ def get_internship_id(internship):
     org = internship.get('org', '')
     return f"{title}_{org}".replace(' ', '_').lower()
 
+def get_text_key(text):
+    """Content hash of an embedding text, used as its key in the embeddings store"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def get_embedding_key(internship):
+    """Embedding store key of an internship: changes whenever its embedded text changes"""
+    key = internship.get('_key')  # Precomputed by load_internships
+    return key if key is not None else get_text_key(get_internship_text(internship))
+
+def drop_stale_embeddings(matrix, ids, live_keys):
+    """Keep only the rows whose keys are in live_keys; returns the (matrix, ids) pair"""
+    keep_rows = [row for row, key in enumerate(ids) if key in live_keys]
+    if len(keep_rows) == len(ids):
+        return matrix, ids
+    return matrix[keep_rows], [ids[row] for row in keep_rows]
+
 def get_file_hash(path):
-    """Get hash of file content for change detection"""
+    """Get hash of file content for change detection (streamed, the file is never read whole)"""
     try:
         with open(path, "rb") as f:
-            file_content = f.read()
-            return hashlib.md5(file_content).hexdigest()
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return hashlib.file_digest(f, "md5").hexdigest()
+            digest = hashlib.md5()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+            return digest.hexdigest()
     except Exception:
         return None
 
+def get_file_mtime_ns(path):
+    """Get file modification time in nanoseconds, a cheap pre-check before hashing"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 def get_internship_text(internship):
     """Generate text representation of internship for embedding"""
-    sectors = internship.get('sector', '')
+    get = internship.get
+    sectors = get('sector', '')
     if isinstance(sectors, list):
         sectors = ', '.join(sectors)
     
-    return (
-        f"Position: {internship.get('title', '')} "
-        f"Company: {internship.get('org', '')} "
-        f"Education Required: {internship.get('required_education', '')} "
-        f"Required Skills: {internship.get('skills', '')} "
-        f"Industry Sector: {sectors} "
-        f"Work Location: {internship.get('location', '')} "
-        f"Description: {internship.get('description', '')[:200]}"  # Include description if available
-    ).strip()
+    return "".join((
+        "Position: ", str(get('title', '')),
+        " Company: ", str(get('org', '')),
+        " Education Required: ", str(get('required_education', '')),
+        " Required Skills: ", str(get('skills', '')),
+        " Industry Sector: ", str(sectors),
+        " Work Location: ", str(get('location', '')),
+        " Description: ", str(get('description', '')[:200])  # Include description if available
+    )).strip()
 
-def precompute_doc_embeddings_new(internships, existing_embeddings=None):
+def precompute_doc_embeddings_new(internships, existing_embeddings=None, checkpoint=None, checkpoint_every=10):
     """
-    Compute embeddings for internships and return updated embeddings dict.
-    Only computes embeddings for internships that don't already have them.
+    Compute embeddings for internships and return the updated (matrix, ids) pair.
+    Rows are keyed by a hash of the embedded text (get_embedding_key), so only
+    new or edited internships are embedded.
+    Documents are sent in batches of EMBED_BATCH_SIZE with up to EMBED_MAX_WORKERS
+    requests in flight.
     
     Args:
         internships: List of internship dictionaries
-        existing_embeddings: Dict of existing embeddings {internship_id: embedding_vector}
+        existing_embeddings: (matrix, keys) pair of existing embeddings, matrix rows aligned with keys
+        checkpoint: Optional callable(matrix, ids) invoked every checkpoint_every batches
+            so partial progress survives a failure
+        checkpoint_every: Number of batches between checkpoint calls
     
     Returns:
-        Dict of embeddings {internship_id: embedding_vector}
+        (matrix, ids) pair with L2-normalized rows for new internships appended
     """
-    if not internships:
-        return existing_embeddings or {}
-    
     if existing_embeddings is None:
-        existing_embeddings = {}
+        existing_embeddings = empty_embeddings()
+    
+    existing_matrix, existing_ids = existing_embeddings
     
-    # Find internships that need embeddings
+    if not internships:
+        return existing_matrix, existing_ids
+    
+    # Find internships whose current text has no embedding yet
+    known_ids = set(existing_ids)
     docs_to_compute = []
     ids_to_compute = []
     
@@ -123,64 +405,89 @@ def precompute_doc_embeddings_new(internships, existing_embeddings=None):
         if not isinstance(internship, dict):
             continue
         
-        internship_id = get_internship_id(internship)
+        key = get_embedding_key(internship)
         
         # Skip if embedding already exists
-        if internship_id in existing_embeddings:
+        if key in known_ids:
             continue
         
         text = get_internship_text(internship)
-        
         if text:  # Only process non-empty text
             docs_to_compute.append(text)
-            ids_to_compute.append(internship_id)
+            ids_to_compute.append(key)
+            known_ids.add(key)
     
     # Compute new embeddings
-    if docs_to_compute:
-        print(f"Computing {len(docs_to_compute)} new embeddings...")
-        try:
-            new_embeddings = embeddings.embed_documents(docs_to_compute)
-            
-            # Add new embeddings to existing ones
-            for i, embedding_vector in enumerate(new_embeddings):
-                existing_embeddings[ids_to_compute[i]] = embedding_vector
-            
-            print(f"✅ Successfully computed {len(new_embeddings)} new embeddings")
-            
-        except Exception as e:
-            print(f"Error computing embeddings: {e}")
-            raise
-    else:
+    if not docs_to_compute:
         print("All internships already have embeddings")
+        return existing_matrix, existing_ids
+    
+    batches = [
+        docs_to_compute[start:start + EMBED_BATCH_SIZE]
+        for start in range(0, len(docs_to_compute), EMBED_BATCH_SIZE)
+    ]
+    print(f"Computing {len(docs_to_compute)} new embeddings in {len(batches)} batches...")
+    
+    # Row blocks are only concatenated at checkpoints and at the end
+    parts = [existing_matrix] if len(existing_ids) else []
+    computed = 0
+    
+    def merged():
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
     
-    return existing_embeddings
+    try:
+        with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as pool:
+            # map() yields batches in submission order while later ones are still in flight
+            for batch_number, batch_vectors in enumerate(pool.map(embeddings.embed_documents, batches), 1):
+                parts.append(normalize_rows(np.array(batch_vectors, dtype=np.float32)))
+                computed += len(batch_vectors)
+                
+                if checkpoint and batch_number % checkpoint_every == 0 and batch_number < len(batches):
+                    parts = [merged()]
+                    checkpoint(parts[0], list(existing_ids) + ids_to_compute[:computed])
+                    print(f"💾 Checkpoint saved after {computed} new embeddings")
+        
+        print(f"✅ Successfully computed {computed} new embeddings")
+    except Exception as e:
+        print(f"Error computing embeddings: {e}")
+        raise
+    
+    return merged(), list(existing_ids) + ids_to_compute
+
+# (internships_path, embeddings_path) -> (mtime_ns, hash) of the internships file as last
+# loaded (or confirmed unchanged) by check_and_update_embeddings in this process
+_processed_sources = {}
+
+def get_processed_source(internships_path, embeddings_path):
+    """(mtime_ns, hash) of the internships file as last loaded by check_and_update_embeddings ((None, None) if never)"""
+    return _processed_sources.get((internships_path, embeddings_path), (None, None))
 
 def check_and_update_embeddings(internships_path, embeddings_path, cached_internships=None, cached_embeddings=None):
     """
     Check if internships file has changed and update embeddings if necessary.
     
     Returns:
-        tuple: (internships, embeddings, updated_flag)
+        tuple: (internships, (matrix, ids), updated_flag)
     """
-    # Check if internships file has changed
-    current_hash = get_file_hash(internships_path)
+    have_cache = cached_internships is not None and cached_embeddings is not None
+    source_key = (internships_path, embeddings_path)
+    last_mtime_ns, last_hash = _processed_sources.get(source_key, (None, None))
     
-    # Load metadata from embeddings file to check last processed hash
-    embeddings_metadata = {}
-    if os.path.exists(embeddings_path):
-        try:
-            with open(embeddings_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                embeddings_metadata = data.get("metadata", {})
-        except Exception:
-            pass
+    # An unchanged mtime means an unchanged file: one stat, no hashing or file reads
+    current_mtime_ns = get_file_mtime_ns(internships_path)
+    if have_cache and current_mtime_ns is not None and current_mtime_ns == last_mtime_ns:
+        return cached_internships, cached_embeddings, False
     
-    last_processed_hash = embeddings_metadata.get("source_file_hash")
+    # Check if internships file has changed
+    current_hash = get_file_hash(internships_path)
+    if last_hash is None:
+        # Cache not loaded by this function: compare against the hash stored with the embeddings
+        last_hash = read_embeddings_metadata(embeddings_path).get("source_file_hash")
     
     # If file hasn't changed and we have cached data, return it
-    if (current_hash == last_processed_hash and 
-        cached_internships is not None and 
-        cached_embeddings is not None):
+    if current_hash == last_hash and have_cache:
+        # Only the mtime moved (e.g. the file was touched); the next check is a plain stat again
+        _processed_sources[source_key] = (current_mtime_ns, current_hash)
         return cached_internships, cached_embeddings, False
     
     # File has changed or no cache - reload and recompute
@@ -190,65 +497,75 @@ def check_and_update_embeddings(internships_path, embeddings_path, cached_intern
     internships = load_internships(internships_path)
     if not internships:
         print("❌ No internships loaded")
-        return [], {}, False
+        return [], empty_embeddings(), False
     
-    # Load existing embeddings
-    existing_embeddings = load_embeddings(embeddings_path)
-    
-    # Compute any missing embeddings
-    updated_embeddings = precompute_doc_embeddings_new(internships, existing_embeddings)
-    
-    # Save updated embeddings with metadata
-    try:
-        data = {
-            "metadata": {
-                "created_at": datetime.now().isoformat(),
-                "total_embeddings": len(updated_embeddings),
-                "embedding_model": EMBED_MODEL_NAME,
+    # Another process may be embedding the same data: wait for it, then reuse what it saved
+    with file_lock(embeddings_path):
+        embeddings_metadata = read_embeddings_metadata(embeddings_path)
+        
+        # Load existing embeddings
+        existing_matrix, existing_ids = load_embeddings(embeddings_path)
+        
+        # Compute any missing embeddings, checkpointing without the source hash so an
+        # interrupted run resumes from the saved rows next time
+        matrix, ids = precompute_doc_embeddings_new(
+            internships,
+            (existing_matrix, existing_ids),
+            checkpoint=lambda partial_matrix, partial_ids: save_embeddings(partial_matrix, partial_ids, embeddings_path)
+        )
+        
+        # Rows for edited or removed internships are no longer referenced
+        matrix, ids = drop_stale_embeddings(matrix, ids, {get_embedding_key(i) for i in internships if isinstance(i, dict)})
+        
+        # Save updated metadata; the matrix file is only rewritten when rows changed
+        # (or when migrating from the legacy JSON-only or non-normalized formats)
+        write_matrix = (
+            ids != existing_ids or
+            not os.path.exists(get_matrix_path(embeddings_path)) or
+            not embeddings_metadata.get("normalized")
+        )
+        save_embeddings(
+            matrix,
+            ids,
+            embeddings_path,
+            metadata={
                 "source_file_hash": current_hash,
                 "source_file_path": internships_path
             },
-            "embeddings": updated_embeddings
-        }
-        with open(embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Updated embeddings saved to {embeddings_path}")
-        
-    except Exception as e:
-        print(f"Error saving updated embeddings: {e}")
-        # Continue with in-memory embeddings even if save fails
+            write_matrix=write_matrix
+        )
+    _processed_sources[source_key] = (current_mtime_ns, current_hash)
+    print(f"✅ Updated embeddings saved to {embeddings_path}")
     
-    return internships, updated_embeddings, True
+    return internships, (matrix, ids), True
 
 # Legacy function kept for backward compatibility
 def precompute_doc_embeddings(internships):
     """
-    Legacy function that adds embeddings directly to internships dicts.
-    Maintained for backward compatibility but not recommended for new code.
+    Legacy function kept for backward compatibility; prefer precompute_doc_embeddings_new.
+    Returns (internships, (matrix, ids)); the vectors are not copied into the internship dicts.
     """
     if not internships:
-        return []
-    
-    # Convert to new format and back
-    embeddings_dict = precompute_doc_embeddings_new(internships, {})
-    
-    # Add embeddings back to internship objects
-    for internship in internships:
-        if isinstance(internship, dict):
-            internship_id = get_internship_id(internship)
-            if internship_id in embeddings_dict:
-                internship["embedding"] = embeddings_dict[internship_id]
+        return [], empty_embeddings()
     
-    return internships
+    return internships, precompute_doc_embeddings_new(internships)
+
+@lru_cache(maxsize=SKILL_TOKEN_CACHE_SIZE)
+def tokenize_skills(skills):
+    """
+    Split a skills string into a frozenset of lowercased, interned tokens
+    Cached per string, so static internship skills are only tokenized once
+    """
+    return frozenset(sys.intern(s.strip().lower()) for s in SKILL_SPLIT.split(skills or "") if s.strip())
 
 def calculate_skill_relevance(user_skills, internship_skills):
     """
     Calculate skill relevance score between user and internship
+    Either argument may be a skills string or a token set from tokenize_skills
     Returns: (exact_matches, partial_matches, relevance_score)
     """
-    user_skill_tokens = set([s.strip().lower() for s in user_skills.split(",") if s.strip()])
-    intern_skill_tokens = set([s.strip().lower() for s in internship_skills.split(",") if s.strip()])
+    user_skill_tokens = tokenize_skills(user_skills) if isinstance(user_skills, str) else user_skills
+    intern_skill_tokens = tokenize_skills(internship_skills) if isinstance(internship_skills, str) else internship_skills
     
     if not user_skill_tokens or not intern_skill_tokens:
         return 0, 0, 0.0
@@ -274,210 +591,601 @@ def calculate_skill_relevance(user_skills, internship_skills):
     
     return len(exact_matches), partial_matches, relevance_score
 
-def recommend(internships, education, skills, location, top_k=5):
+def build_skill_matrix(internships):
+    """
+    Encode internship skills as a sparse internship x skill matrix
+    Returns: (vocab, matrix, substring_index) where vocab maps each lowercased skill to its
+    column, matrix is a CSR matrix with a 1 for every skill an internship lists (sorted per
+    row) and substring_index is build_substring_index(vocab)
+    """
+    vocab = {}
+    indptr = [0]
+    indices = []
+    for internship in internships:
+        skills = internship.get("skills", "") if isinstance(internship, dict) else ""
+        indices.extend(sorted({vocab.setdefault(token, len(vocab)) for token in tokenize_skills(skills)}))
+        indptr.append(len(indices))
+    
+    skill_matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+        shape=(len(internships), len(vocab))
+    )
+    return vocab, skill_matrix, build_substring_index(vocab)
+
+def select_skill_rows(skill_matrix, rows):
+    """Skill matrix restricted to the given rows (same vocab), e.g. for a prefiltered subset"""
+    vocab, matrix, substring_index = skill_matrix
+    return vocab, matrix[np.asarray(rows, dtype=np.intp)], substring_index
+
+def build_substring_index(vocab):
+    """
+    Index the skills eligible for partial matching (longer than 2 characters)
+    Returns: (tokens, skill_ids, automaton, joined, starts)
+        automaton: Aho-Corasick automaton over the tokens (None without pyahocorasick)
+        joined: the tokens joined with NUL separators, token i starting at starts[i]
+    """
+    tokens = [token for token in vocab if len(token) > 2]
+    skill_ids = [vocab[token] for token in tokens]
+    
+    starts = []
+    offset = 0
+    for token in tokens:
+        starts.append(offset)
+        offset += len(token) + 1
+    
+    automaton = None
+    if ahocorasick is not None and tokens:
+        automaton = ahocorasick.Automaton()
+        for token, skill_id in zip(tokens, skill_ids):
+            automaton.add_word(token, skill_id)
+        automaton.make_automaton()
+    
+    return tokens, skill_ids, automaton, "\0".join(tokens), starts
+
+def related_skill_ids(substring_index, user_skill):
+    """Ids of the indexed skills that contain user_skill or are contained in it"""
+    tokens, skill_ids, automaton, joined, starts = substring_index
+    related = set()
+    
+    # Skills inside the user skill: one automaton walk over the user skill
+    if automaton is not None:
+        related.update(skill_id for _, skill_id in automaton.iter(user_skill))
+    else:
+        related.update(skill_id for token, skill_id in zip(tokens, skill_ids) if token in user_skill)
+    
+    # Skills containing the user skill: C-level str.find over the joined skills
+    pos = joined.find(user_skill)
+    while pos != -1:
+        k = bisect.bisect_right(starts, pos) - 1
+        related.add(skill_ids[k])
+        next_start = starts[k + 1] if k + 1 < len(starts) else len(joined)
+        pos = joined.find(user_skill, next_start)
+    
+    return related
+
+def encode_user_skills(vocab, substring_index, user_tokens):
+    """
+    Map user skill tokens onto the skill vocabulary
+    Returns: (user_ids, partial_ids, related)
+        user_ids: sorted vocab ids of the user's skills (for exact matches)
+        partial_ids: vocab id (or -1) of each user skill eligible for partial matching
+        related: bool (len(partial_ids), len(vocab)), True where the skills contain one another
+    """
+    user_ids = np.array(sorted(vocab[token] for token in user_tokens if token in vocab), dtype=np.int32)
+    partial_tokens = [token for token in user_tokens if len(token) > 2]
+    partial_ids = np.array([vocab.get(token, -1) for token in partial_tokens], dtype=np.int32)
+    
+    related = np.zeros((len(partial_tokens), len(vocab)), dtype=np.bool_)
+    for k, user_skill in enumerate(partial_tokens):
+        related[k, list(related_skill_ids(substring_index, user_skill))] = True
+    
+    return user_ids, partial_ids, related
+
+def _skill_overlap_loops(indptr, indices, user_ids, partial_ids, related):
+    """Per-row exact / partial skill match counts over CSR arrays as plain loops (compiled with numba; mirrored in _scorer.pyx)"""
+    n = len(indptr) - 1
+    exact = np.zeros(n, dtype=np.int32)
+    partial = np.zeros(n, dtype=np.int32)
+    for row in range(n):
+        start = indptr[row]
+        end = indptr[row + 1]
+        
+        # Exact matches: merge the two sorted id lists
+        i = start
+        j = 0
+        while i < end and j < len(user_ids):
+            if indices[i] == user_ids[j]:
+                exact[row] += 1
+                i += 1
+                j += 1
+            elif indices[i] < user_ids[j]:
+                i += 1
+            else:
+                j += 1
+        
+        # Partial matches: count each non-exact user skill once if any internship skill is related
+        for k in range(len(partial_ids)):
+            is_exact = False
+            for i in range(start, end):
+                if indices[i] == partial_ids[k]:
+                    is_exact = True
+                    break
+            if is_exact:
+                continue
+            for i in range(start, end):
+                if related[k, indices[i]]:
+                    partial[row] += 1
+                    break
+    
+    return exact, partial
+
+def _skill_overlap_sparse(skill_matrix, user_ids, partial_ids, related):
+    """Same counts as _skill_overlap_loops as sparse matrix products, used when no compiled kernel is available"""
+    n_skills = skill_matrix.shape[1]
+    
+    # Exact matches: one SpMV with the user's skill indicator vector
+    user_vector = np.zeros(n_skills, dtype=np.int32)
+    user_vector[user_ids] = 1
+    exact = (skill_matrix @ user_vector).astype(np.int32)
+    
+    if not len(partial_ids):
+        return exact, np.zeros(skill_matrix.shape[0], dtype=np.int32)
+    
+    # (N, K): does the internship list a skill related to user skill k / user skill k itself
+    has_related = (skill_matrix @ related.T.astype(np.int32)) > 0
+    user_columns = np.zeros((n_skills, len(partial_ids)), dtype=np.int32)
+    known = partial_ids >= 0
+    user_columns[partial_ids[known], np.flatnonzero(known)] = 1
+    has_exact = (skill_matrix @ user_columns) > 0
+    
+    partial = np.count_nonzero(has_related & ~has_exact, axis=1).astype(np.int32)
+    return exact, partial
+
+if _scorer is not None:
+    def skill_overlap_counts(skill_matrix, user_ids, partial_ids, related):
+        """Exact / partial skill match counts for every row of the skill matrix"""
+        return _scorer.skill_overlap_counts(
+            skill_matrix.indptr.astype(np.int32, copy=False),
+            skill_matrix.indices.astype(np.int32, copy=False),
+            user_ids, partial_ids, related.view(np.uint8)
+        )
+elif njit is not None:
+    _skill_overlap_compiled = njit(cache=True)(_skill_overlap_loops)
+    
+    def skill_overlap_counts(skill_matrix, user_ids, partial_ids, related):
+        """Exact / partial skill match counts for every row of the skill matrix"""
+        return _skill_overlap_compiled(skill_matrix.indptr, skill_matrix.indices, user_ids, partial_ids, related)
+else:
+    skill_overlap_counts = _skill_overlap_sparse
+
+def filter_by_skill_relevance(internships, skills, skill_matrix=None):
+    """
+    Step 1 of recommendation: keep internships with some skill relevance
+    skill_matrix: optional precomputed build_skill_matrix(internships)
+    Returns: (indices of relevant internships, relevance data) where the relevance data maps
+    'exact_matches', 'partial_matches' and 'relevance_score' to arrays aligned with the indices
+    
+    Same scoring as calculate_skill_relevance, computed for all internships at once
+    on the sparse skill matrix.
+    """
+    user_tokens = tokenize_skills(skills)
+    if not user_tokens or not internships:
+        return [], {}
+    
+    if skill_matrix is None:
+        skill_matrix = build_skill_matrix(internships)
+    vocab, matrix, substring_index = skill_matrix
+    
+    user_ids, partial_ids, related = encode_user_skills(vocab, substring_index, user_tokens)
+    exact, partial = skill_overlap_counts(matrix, user_ids, partial_ids, related)
+    relevance = (exact * 1.0 + partial * 0.6) / len(user_tokens)
+    
+    # Only include internships with some skill relevance
+    # Threshold: at least 1 exact match OR 2 partial matches OR relevance score > 0.2
+    relevant = np.flatnonzero((exact > 0) | (partial >= 2) | (relevance > 0.2))
+    skill_relevance_data = {
+        'exact_matches': exact[relevant],
+        'partial_matches': partial[relevant],
+        'relevance_score': relevance[relevant]
+    }
+    
+    return relevant.tolist(), skill_relevance_data
+
+def value_match_mask(values, predicate):
+    """Boolean array of predicate(value) for each value, evaluating each distinct value once"""
+    matches = {value: bool(predicate(value)) for value in set(values)}
+    return np.fromiter((matches[value] for value in values), dtype=np.bool_, count=len(values))
+
+def education_matches(req_edu, user_edu):
+    """Education boost condition for one lowercased required_education value"""
+    return bool(req_edu and user_edu) and (req_edu == user_edu or req_edu in user_edu or user_edu in req_edu)
+
+def location_matches(intern_loc, user_loc):
+    """Location boost condition for one lowercased internship location"""
+    return bool(user_loc and intern_loc) and (
+        user_loc == intern_loc or
+        "remote" in intern_loc or
+        user_loc == "remote" or
+        any(loc in intern_loc for loc in user_loc.split()) or
+        any(loc in user_loc for loc in intern_loc.split())
+    )
+
+def rank_candidates(candidates, skill_relevance_data, semantic_scores, education, location, top_k):
+    """
+    Steps 3-4 of recommendation: apply education/skill/location boosts and select top_k
+    
+    candidates: skill-relevant internship dicts
+    skill_relevance_data: relevance arrays aligned with candidates (see filter_by_skill_relevance)
+    semantic_scores: semantic similarity aligned with candidates
+    returns: list of (candidate index, score, match_details) for the top_k candidates, best first
+    """
+    if not candidates:
+        return []
+    
+    user_edu = education.lower()
+    user_loc = location.lower()
+    
+    # Match conditions are evaluated once per distinct education / location value
+    edu_mask = value_match_mask(
+        [str(internship.get("required_education", "")).lower() for internship in candidates],
+        lambda req_edu: education_matches(req_edu, user_edu)
+    )
+    location_mask = value_match_mask(
+        [str(internship.get("location", "")).lower() for internship in candidates],
+        lambda intern_loc: location_matches(intern_loc, user_loc)
+    )
+    exact_matches = skill_relevance_data['exact_matches']
+    partial_matches = skill_relevance_data['partial_matches']
+    
+    # Step 3: boosts, accumulated in the same order as the per-candidate formula
+    boost = np.where(edu_mask, 0.25, 0.0)  # Education - HIGH priority
+    boost += 0.30 * exact_matches  # Skills - HIGHEST priority: heavy weight for exact matches
+    boost += 0.15 * np.minimum(partial_matches, 3)  # Moderate weight for partial matches
+    boost += np.where(location_mask, 0.08, 0.0)  # Location - MINIMAL priority
+    scores = np.asarray(semantic_scores, dtype=np.float64) + boost
+    
+    # Step 4: Partial selection of the top_k scores, then sort only those
+    # (selected indices are pre-sorted so ties keep candidate order, as a stable sort would)
+    top_k = min(top_k, len(scores))
+    top_indices = np.sort(np.argpartition(-scores, top_k - 1)[:top_k])
+    top_indices = top_indices[np.argsort(-scores[top_indices], kind="stable")]
+    
+    # match_details are only built for the selected candidates
+    hits = []
+    for i in top_indices:
+        hits.append((int(i), float(scores[i]), {
+            'exact_skill_matches': int(exact_matches[i]),
+            'partial_skill_matches': int(partial_matches[i]),
+            'skill_relevance_score': float(skill_relevance_data['relevance_score'][i]),
+            'education_match': bool(edu_mask[i]),
+            'location_match': bool(location_mask[i]),
+            'semantic_similarity': semantic_scores[i]
+        }))
+    
+    return hits
+
+def select_fallback(semantic_scores, top_k):
+    """
+    Select the top_k fallback matches by semantic score
+    returns: list of (index, score, match_details), best first
+    """
+    semantic_scores = np.asarray(semantic_scores)
+    top_k = min(top_k, len(semantic_scores))
+    
+    # Partial selection of the top_k scores, then sort only those
+    top_indices = np.argpartition(-semantic_scores, top_k - 1)[:top_k]
+    idx_sorted = top_indices[np.argsort(-semantic_scores[top_indices])]
+    
+    hits = []
+    for idx in idx_sorted:
+        score = float(semantic_scores[idx])
+        hits.append((int(idx), score, {
+            'exact_skill_matches': 0,
+            'partial_skill_matches': 0,
+            'skill_relevance_score': 0.0,
+            'education_match': False,
+            'location_match': False,
+            'semantic_similarity': score,
+            'fallback_recommendation': True
+        }))
+    
+    return hits
+
+def stack_embeddings(internships, embeddings=None):
+    """
+    Gather the rows of an embeddings (matrix, ids) pair for internships into one
+    L2-normalized float32 matrix aligned with internships
+    Rows for internships without a stored embedding are left as zeros (similarity 0)
+    """
+    matrix, ids = embeddings if embeddings is not None else empty_embeddings()
+    key_to_row = {key: row for row, key in enumerate(ids)}
+    rows = [key_to_row.get(get_embedding_key(internship)) if isinstance(internship, dict) else None
+            for internship in internships]
+    
+    stacked = np.zeros((len(internships), matrix.shape[1]), dtype=np.float32)
+    hits = [n for n, row in enumerate(rows) if row is not None]
+    if hits:
+        stacked[hits] = matrix[[rows[n] for n in hits]]
+    
+    return normalize_rows(stacked)
+
+def build_result(internship, score, match_details):
+    """Copy an internship into a response dict with 'score' and 'match_details', without its internal fields"""
+    result = public_internship(internship)
+    result['score'] = score
+    result['match_details'] = match_details
+    return result
+
+def clean_profile(education, skills, location):
+    """Profile fields as stripped strings, with missing values as empty strings"""
+    education = str(education).strip() if education else ""
+    skills = str(skills).strip() if skills else ""
+    location = str(location).strip() if location else ""
+    return education, skills, location
+
+def build_query(education, skills, location):
+    """Embedding query text for a profile cleaned by clean_profile"""
+    return f"Skills: {skills} {skills} {skills}, Education: {education} {education}, Position: {location}"
+
+def recommend(internships, education, skills, location, top_k=5, embeddings=None):
     """
     Enhanced recommendation function with skill-first filtering
     
-    internships: list of internship dicts (each with 'embedding' list)
+    internships: list of internship dicts
     education, skills, location: strings
     top_k: number of recommendations (clamped between 3-7)
+    embeddings: (matrix, ids) pair as returned by precompute_doc_embeddings_new
     returns: list of top_k internship dicts with added 'score' and 'match_details'
     """
     # Input validation
     if not internships or not isinstance(internships, list):
         return []
     
-    education = str(education).strip() if education else ""
-    skills = str(skills).strip() if skills else ""
-    location = str(location).strip() if location else ""
+    education, skills, location = clean_profile(education, skills, location)
     
     # Ensure top_k is within desired range (3-7)
     top_k = max(3, min(7, top_k))
     
     # Step 1: Filter internships by skill relevance
-    skill_relevant_internships = []
-    skill_relevance_data = []
-    
-    for i, internship in enumerate(internships):
-        if not isinstance(internship, dict):
-            continue
-            
-        internship_skills = internship.get("skills", "")
-        exact_matches, partial_matches, relevance_score = calculate_skill_relevance(skills, internship_skills)
-        
-        # Only include internships with some skill relevance
-        # Threshold: at least 1 exact match OR 2 partial matches OR relevance score > 0.2
-        if exact_matches > 0 or partial_matches >= 2 or relevance_score > 0.2:
-            skill_relevant_internships.append(internship)
-            skill_relevance_data.append({
-                'original_index': i,
-                'exact_matches': exact_matches,
-                'partial_matches': partial_matches,
-                'relevance_score': relevance_score
-            })
+    relevant_indices, skill_relevance_data = filter_by_skill_relevance(internships, skills)
+    skill_relevant_internships = [internships[i] for i in relevant_indices]
     
     # If no skill-relevant internships, use semantic similarity fallback
     if not skill_relevant_internships:
-        return semantic_fallback_recommendation(internships, education, skills, location, top_k)
+        return semantic_fallback_recommendation(internships, education, skills, location, top_k, embeddings)
     
     # Adjust top_k based on available skill-relevant internships
     top_k = min(top_k, len(skill_relevant_internships))
     
     # Step 2: Compute semantic similarity for skill-relevant internships
-    query = f"Skills: {skills} {skills} {skills}, Education: {education} {education}, Position: {location}"
+    query = build_query(education, skills, location)
+    
+    q_vec = embed_query_normalized(query)
+    if q_vec is None:
+        return []
+    
+    # One matrix-vector product over all skill-relevant internships
+    doc_matrix = stack_embeddings(skill_relevant_internships, embeddings)
+    if doc_matrix.shape[1] == q_vec.shape[0]:
+        semantic_scores = similarity_scores(doc_matrix, q_vec).tolist()
+    else:
+        semantic_scores = [0.0] * len(skill_relevant_internships)
     
+    # Step 3 & 4: Calculate boosted scores and return top results
+    hits = rank_candidates(skill_relevant_internships, skill_relevance_data, semantic_scores, education, location, top_k)
+    return [build_result(skill_relevant_internships[i], score, details) for i, score, details in hits]
+
+def semantic_fallback_recommendation(internships, education, skills, location, top_k, embeddings=None):
+    """
+    Fallback recommendation based purely on semantic similarity
+    Used when no skill-relevant internships are found
+    """
+    # Internships without an embedding get a zero row and never pass the similarity threshold
+    doc_matrix = stack_embeddings(internships, embeddings)
+    hits = rank_fallback_matrix(doc_matrix, education, skills, top_k)
+    return [build_result(internships[row], score, details) for row, score, details in hits]
+
+def similarity_scores(matrix, q_vecs):
+    """
+    Dot products of normalized query vector(s) against the rows of a normalized
+    matrix, i.e. cosine similarities. q_vecs may be one vector (returns shape (N,))
+    or a (B, D) block (returns (B, N)). Uses SimSIMD when installed, NumPy otherwise.
+    """
+    if (simsimd is not None and matrix.dtype == np.float32 and matrix.flags.c_contiguous
+            and q_vecs.dtype == np.float32 and len(matrix) and len(q_vecs)):
+        scores = np.asarray(simsimd.cdist(np.atleast_2d(q_vecs), matrix, metric="dot"), dtype=np.float32)
+        return scores[0] if q_vecs.ndim == 1 else scores
+    return matrix @ q_vecs if q_vecs.ndim == 1 else q_vecs @ matrix.T
+
+@lru_cache(maxsize=QUERY_EMBED_CACHE_SIZE)
+def _embed_query(query):
+    """Raw query embedding as a tuple; repeated queries skip the model call (failures are not cached)"""
+    return tuple(embeddings.embed_query(query))
+
+def embed_query_normalized(query):
+    """Embed a query and return it as an L2-normalized float32 vector (None on failure)"""
     try:
-        q_emb = embeddings.embed_query(query)
-        q_vec = np.array(q_emb).reshape(1, -1)
+        q_vec = np.asarray(_embed_query(query), dtype=np.float32)
     except Exception as e:
         print(f"Error computing query embedding: {e}")
+        return None
+    
+    norm_sq = np.vdot(q_vec, q_vec)
+    if norm_sq > 0:
+        q_vec /= np.sqrt(norm_sq)
+    return q_vec
+
+def rank_matrix(matrix, meta, education, skills, location, top_k=5, scores=None, skill_matrix=None):
+    """
+    Rank internships over a cached embedding matrix (same ranking as recommend)
+    
+    matrix: (N, D) float32 array of L2-normalized internship embeddings
+    meta: list of N internship dicts aligned with the rows of matrix
+    education, skills, location: strings
+    top_k: number of recommendations (clamped between 3-7)
+    scores: optional precomputed cosine similarities of the query against every row
+    skill_matrix: optional precomputed build_skill_matrix(meta)
+    returns: list of (row, score, match_details) for the top_k internships, best first
+    """
+    if matrix is None or not meta:
         return []
     
-    semantic_scores = []
-    for internship in skill_relevant_internships:
-        doc_emb = np.array(internship.get("embedding", []))
-        if doc_emb.size == 0:
-            semantic_scores.append(0.0)
-            continue
-        try:
-            sim = cosine_similarity(q_vec, doc_emb.reshape(1, -1))[0][0]
-            semantic_scores.append(float(sim))
-        except Exception:
-            semantic_scores.append(0.0)
+    education, skills, location = clean_profile(education, skills, location)
     
-    # Step 3: Calculate boosted scores
-    user_edu = education.lower()
-    user_loc = location.lower()
+    top_k = max(3, min(7, top_k))
     
-    final_scores = []
-    for i, internship in enumerate(skill_relevant_internships):
-        base_score = semantic_scores[i]
-        boost = 0.0
-        relevance_data = skill_relevance_data[i]
-        
-        # Education boost - HIGH priority
-        req_edu = str(internship.get("required_education", "")).lower()
-        edu_match = False
-        if req_edu and user_edu:
-            if req_edu == user_edu or req_edu in user_edu or user_edu in req_edu:
-                boost += 0.25
-                edu_match = True
-        
-        # Skill boosts - HIGHEST priority
-        exact_matches = relevance_data['exact_matches']
-        partial_matches = relevance_data['partial_matches']
-        
-        boost += 0.30 * exact_matches  # Heavy weight for exact skill matches
-        boost += 0.15 * min(partial_matches, 3)  # Moderate weight for partial matches
-        
-        # Location boost - MINIMAL priority
-        intern_loc = str(internship.get("location", "")).lower()
-        location_match = False
-        if user_loc and intern_loc:
-            if (user_loc == intern_loc or 
-                "remote" in intern_loc or 
-                user_loc == "remote" or
-                any(loc in intern_loc for loc in user_loc.split()) or
-                any(loc in user_loc for loc in intern_loc.split())):
-                boost += 0.08
-                location_match = True
-        
-        final_score = base_score + boost
-        final_scores.append({
-            'score': final_score,
-            'internship': internship,
-            'match_details': {
-                'exact_skill_matches': exact_matches,
-                'partial_skill_matches': partial_matches,
-                'skill_relevance_score': relevance_data['relevance_score'],
-                'education_match': edu_match,
-                'location_match': location_match,
-                'semantic_similarity': base_score
-            }
-        })
-    
-    # Step 4: Sort and return top results
-    final_scores.sort(key=lambda x: x['score'], reverse=True)
-    
-    results = []
-    for item in final_scores[:top_k]:
-        internship_copy = item['internship'].copy()
-        internship_copy['score'] = float(item['score'])
-        internship_copy['match_details'] = item['match_details']
-        
-        # Remove embedding to keep response lightweight
-        if 'embedding' in internship_copy:
-            del internship_copy['embedding']
-        
-        results.append(internship_copy)
+    # Step 1: Filter internships by skill relevance
+    relevant_indices, skill_relevance_data = filter_by_skill_relevance(meta, skills, skill_matrix)
     
-    return results
+    if not relevant_indices:
+        return rank_fallback_matrix(matrix, education, skills, top_k)
+    
+    top_k = min(top_k, len(relevant_indices))
+    
+    # Step 2: Rows are pre-normalized, so a single matrix-vector product gives every cosine similarity
+    if scores is None:
+        query = build_query(education, skills, location)
+        q_vec = embed_query_normalized(query)
+        if q_vec is None:
+            return []
+        if matrix.shape[1] == q_vec.shape[0]:
+            scores = similarity_scores(matrix, q_vec)
+        else:
+            scores = np.zeros(len(matrix), dtype=np.float32)
+    
+    semantic_scores = scores[relevant_indices].tolist()
+    candidates = [meta[i] for i in relevant_indices]
+    
+    hits = rank_candidates(candidates, skill_relevance_data, semantic_scores, education, location, top_k)
+    return [(relevant_indices[i], score, details) for i, score, details in hits]
 
-def semantic_fallback_recommendation(internships, education, skills, location, top_k):
-    """
-    Fallback recommendation based purely on semantic similarity
-    Used when no skill-relevant internships are found
-    """
+def rank_fallback_matrix(matrix, education, skills, top_k):
+    """Semantic-only fallback over a normalized embedding matrix, returning (row, score, match_details)"""
     query = f"Skills: {skills} {skills} {skills} {skills}, Education: {education} {education}"
+    q_vec = embed_query_normalized(query)
+    if q_vec is None or matrix.shape[1] != q_vec.shape[0]:
+        return []
     
-    try:
-        q_emb = embeddings.embed_query(query)
-        q_vec = np.array(q_emb).reshape(1, -1)
-    except Exception:
+    scores = similarity_scores(matrix, q_vec)
+    valid_indices = np.flatnonzero(scores > 0.4)  # Only include reasonably similar internships
+    
+    if not valid_indices.size:
         return []
     
-    semantic_scores = []
-    valid_internships = []
+    hits = select_fallback(scores[valid_indices], top_k)
+    return [(int(valid_indices[i]), score, details) for i, score, details in hits]
+
+def build_prefilter_indexes(meta):
+    """
+    Inverted indexes from lowercased location / required education to matrix rows
+    Returns: (loc_index, edu_index) dicts of str -> int row index arrays
+    """
+    loc_rows = {}
+    edu_rows = {}
+    for row, internship in enumerate(meta):
+        loc = str(internship.get("location", "")).strip().lower()
+        edu = str(internship.get("required_education", "")).strip().lower()
+        if loc:
+            loc_rows.setdefault(loc, []).append(row)
+        if edu:
+            edu_rows.setdefault(edu, []).append(row)
     
-    for internship in internships:
-        if not isinstance(internship, dict):
-            continue
-            
-        doc_emb = np.array(internship.get("embedding", []))
-        if doc_emb.size == 0:
-            continue
-            
-        try:
-            sim = cosine_similarity(q_vec, doc_emb.reshape(1, -1))[0][0]
-            if sim > 0.4:  # Only include reasonably similar internships
-                semantic_scores.append(sim)
-                valid_internships.append(internship)
-        except Exception:
-            continue
+    loc_index = {key: np.asarray(rows, dtype=np.intp) for key, rows in loc_rows.items()}
+    edu_index = {key: np.asarray(rows, dtype=np.intp) for key, rows in edu_rows.items()}
+    return loc_index, edu_index
+
+def prefilter_rows(loc_index, edu_index, education, location):
+    """
+    Rows matching the user's location (plus remote internships) or education
+    Returns None when neither value is indexed, meaning no prefilter applies
+    """
+    user_loc = str(location).strip().lower() if location else ""
+    user_edu = str(education).strip().lower() if education else ""
     
-    if not valid_internships:
-        return []
+    parts = []
+    # Remote users get the location boost everywhere, so location does not narrow their search
+    if user_loc in loc_index and user_loc != "remote":
+        parts.append(loc_index[user_loc])
+        if "remote" in loc_index:
+            parts.append(loc_index["remote"])
+    if user_edu in edu_index:
+        parts.append(edu_index[user_edu])
     
-    # Get top semantic matches
-    top_k = min(top_k, len(valid_internships))
-    idx_sorted = np.argsort(semantic_scores)[-top_k:][::-1]
+    if not parts:
+        return None
+    return np.unique(np.concatenate(parts))
+
+def rank_matrix_subset(matrix, meta, rows, education, skills, location, top_k=5, skill_matrix=None):
+    """
+    Rank only the given matrix rows (e.g. from prefilter_rows), so the matrix-vector
+    product covers M rows instead of N. Falls back to all rows when the subset
+    yields fewer results than requested.
+    """
+    subset_skills = select_skill_rows(skill_matrix, rows) if skill_matrix is not None else None
+    hits = rank_matrix(matrix[rows], [meta[row] for row in rows], education, skills, location, top_k,
+                       skill_matrix=subset_skills)
+    if len(hits) < max(3, min(7, top_k)):
+        return rank_matrix(matrix, meta, education, skills, location, top_k, skill_matrix=skill_matrix)
+    return [(int(rows[i]), score, details) for i, score, details in hits]
+
+def recommend_matrix(matrix, meta, education, skills, location, top_k=5, candidate_rows=None, skill_matrix=None):
+    """
+    Recommendation over a cached embedding matrix
+    returns: list of top_k internship dicts with added 'score' and 'match_details'
+    Only the returned internships are copied; see rank_matrix for the arguments.
+    candidate_rows: optional row indices to restrict scoring to (see prefilter_rows)
+    """
+    if candidate_rows is not None and matrix is not None and len(candidate_rows):
+        hits = rank_matrix_subset(matrix, meta, candidate_rows, education, skills, location, top_k, skill_matrix)
+    else:
+        hits = rank_matrix(matrix, meta, education, skills, location, top_k, skill_matrix=skill_matrix)
+    return [build_result(meta[row], score, details) for row, score, details in hits]
+
+def recommend_matrix_batch(matrix, meta, profiles, skill_matrix=None):
+    """
+    Recommendations for several profiles at once
     
-    results = []
-    for idx in idx_sorted:
-        internship_copy = valid_internships[idx].copy()
-        internship_copy['score'] = float(semantic_scores[idx])
-        internship_copy['match_details'] = {
-            'exact_skill_matches': 0,
-            'partial_skill_matches': 0,
-            'skill_relevance_score': 0.0,
-            'education_match': False,
-            'location_match': False,
-            'semantic_similarity': semantic_scores[idx],
-            'fallback_recommendation': True
-        }
-        
-        if 'embedding' in internship_copy:
-            del internship_copy['embedding']
-        
-        results.append(internship_copy)
+    profiles: list of (education, skills, location, top_k) tuples
+    skill_matrix: optional precomputed build_skill_matrix(meta)
+    returns: list of recommendation lists aligned with profiles
+    
+    Queries are embedded as in recommend_matrix (and share its query cache), then scored
+    against the matrix with a single matrix-matrix product; each profile is then ranked
+    as in recommend_matrix.
+    """
+    if matrix is None or not meta or not profiles:
+        return [[] for _ in profiles]
+    
+    q_vecs = [
+        embed_query_normalized(build_query(*clean_profile(education, skills, location)))
+        for education, skills, location, _ in profiles
+    ]
+    
+    # Profiles whose query embedding failed get no results, like recommend_matrix
+    embedded = [i for i, q_vec in enumerate(q_vecs) if q_vec is not None]
+    results = [[] for _ in profiles]
+    if not embedded:
+        return results
+    
+    # (B, D) @ (D, N) -> (B, N) cosine similarities for every profile
+    q_matrix = np.stack([q_vecs[i] for i in embedded])
+    if matrix.shape[1] == q_matrix.shape[1]:
+        all_scores = similarity_scores(matrix, q_matrix)
+    else:
+        all_scores = np.zeros((len(embedded), len(matrix)), dtype=np.float32)
+    
+    for i, scores in zip(embedded, all_scores):
+        education, skills, location, top_k = profiles[i]
+        hits = rank_matrix(matrix, meta, education, skills, location, top_k, scores=scores, skill_matrix=skill_matrix)
+        results[i] = [build_result(meta[row], score, details) for row, score, details in hits]
     
     return results
 
 # Backward compatibility functions
-def get_recommendations(internships, education, skills, location, num_recommendations=5):
+def get_recommendations(internships, education, skills, location, num_recommendations=5, embeddings=None):
     """Alternative function name for backward compatibility"""
-    return recommend(internships, education, skills, location, num_recommendations)
+    return recommend(internships, education, skills, location, num_recommendations, embeddings)
 
-def recommend_with_validation(internships, education, skills, location, top_k=5):
+def recommend_with_validation(internships, education, skills, location, top_k=5, embeddings=None):
     """Recommendation function with enhanced input validation"""
-    return recommend(internships, education, skills, location, top_k)
\ No newline at end of file
+    return recommend(internships, education, skills, location, top_k, embeddings)
\ No newline at end of file